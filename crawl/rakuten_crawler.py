@@ -1,11 +1,29 @@
+import asyncio
 import os
 import json
+import random
+import shutil
 import time
 import re
 import requests
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from playwright.sync_api import sync_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright
+from requests.adapters import HTTPAdapter
+
+# orjson이 있으면 C 구현 직렬화 사용 (없어도 stdlib json으로 동작)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False)
 
 # ==========================================
 # 1. 설정 (Configuration)
@@ -20,6 +38,13 @@ IMAGE_DIR = "images"
 NAV_TIMEOUT_MS = 30000
 LIST_TIMEOUT_MS = 15000
 NAV_RETRIES = 2
+NAV_BACKOFF_CAP_SEC = 10
+
+# 크롤 전체 실행 시간 한도 (초). 넘어서면 재시도하지 않고 바로 포기
+CRAWL_BUDGET_SEC = 60 * 60
+
+# run_async 시작 시점에 설정되는 전역 데드라인
+_deadline = None
 
 # [수정 2] 파일명에 시/분/초 추가 (예: 20240208_153022_products.json)
 current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -28,6 +53,67 @@ DATA_FILE = f"{current_time}_products.json"
 if not os.path.exists(IMAGE_DIR):
     os.makedirs(IMAGE_DIR)
 
+# 이미지 다운로드 병렬화 설정
+DOWNLOAD_WORKERS = 8
+
+# URL이 여러 개일 때 동시에 돌릴 브라우저 컨텍스트 수
+# (브라우저는 1개만 띄우고 컨텍스트만 늘려서 메모리 사용을 억제)
+CONTEXT_COUNT = 4
+
+# 이미지가 전부 같은 CDN 호스트라 커넥션 재사용(keep-alive) 효과가 큼
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+
+# navigator.webdriver를 false로 설정 (봇 감지 우회 핵심)
+STEALTH_INIT_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => [1, 2, 3, 4, 5]
+    });
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['ja-JP', 'ja', 'en-US', 'en']
+    });
+    window.chrome = { runtime: {} };
+"""
+
+# 상품 목록과 카테고리를 브라우저 안에서 한 번에 추출하는 JS
+# (locator 호출은 건당 IPC 왕복이라 상품 수 x 필드 수 만큼 느려짐)
+# 카테고리는 깊은 positional XPath 대신 #container 기준 CSS 셀렉터로 탐색
+EXTRACT_PAGE_JS = """
+() => {
+    const catEl = document.querySelector('#container h1');
+    return {
+        category: catEl ? catEl.innerText : '',
+        items: Array.from(
+            document.querySelectorAll('#item-list .product-item:not(.product-item-next)')
+        ).map(el => {
+            const link = el.querySelector('a');
+            const img = el.querySelector('img.img-base-size');
+            return {
+                id: el.dataset.ratid || '',
+                maker: el.querySelector('.product-item-info-maker')?.innerText || '',
+                name: el.querySelector('.product-item-info-name')?.innerText || '',
+                price: el.querySelector('.product-item-info-price')?.innerText || '',
+                url: link ? (link.getAttribute('href') || '') : '',
+                img: img ? (img.getAttribute('data-src') || img.getAttribute('src') || '') : '',
+            };
+        }),
+    };
+};
+"""
+
+# 핫루프에서 쓰는 정규식은 모듈 로드 시 한 번만 컴파일
+_PRICE_RE = re.compile(r'[^0-9]')
+_CAT_RE = re.compile(r'\s*\d+～\d+件.*')
+_FN_SAFE_RE = re.compile(r'[\\/*?:"<>|]')
+_ITEM_ID_RE = re.compile(r'/item/(\d+)')
+
+# 브라우저에서 차단할 리소스 (상품 이미지는 requests로 따로 받으므로 불필요)
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+BLOCKED_HOST_KEYWORDS = ("criteo", "doubleclick", "google-analytics", "googletagmanager")
+
 # ==========================================
 # 2. 헬퍼 함수
 # ==========================================
@@ -48,238 +134,275 @@ def download_image(url, filename):
     if not url: return False
     if url.startswith("//"):
         url = "https:" + url
-        
+
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            with open(os.path.join(IMAGE_DIR, filename), 'wb') as f:
-                f.write(response.content)
-            return True
+        with session.get(url, timeout=10, stream=True) as response:
+            if response.status_code == 200:
+                # raw 직접 복사는 Content-Encoding(gzip 등) 해제를 건너뛰므로
+                # 디코딩을 켜야 저장 파일이 실제 이미지 바이트가 됨
+                response.raw.decode_content = True
+                with open(os.path.join(IMAGE_DIR, filename), 'wb') as f:
+                    shutil.copyfileobj(response.raw, f)
+                return True
     except Exception:
         pass
     return False
 
-def navigate_and_wait(page, url):
+async def _block_heavy_resources(route):
+    """목록 HTML 파싱에 필요 없는 이미지/폰트/광고 요청을 차단."""
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+        return
+    if any(keyword in request.url for keyword in BLOCKED_HOST_KEYWORDS):
+        await route.abort()
+        return
+    await route.continue_()
+
+async def navigate_and_wait(page, url):
     """페이지 이동 후 상품 리스트가 보일 때까지 대기 (재시도 포함)."""
     last_error = None
     for attempt in range(1, NAV_RETRIES + 1):
+        if _deadline is not None and time.monotonic() >= _deadline:
+            print("   ⏰ 전체 실행 시간 한도 초과, 재시도 중단")
+            break
         try:
-            page.goto(url, wait_until="domcontentloaded", timeout=NAV_TIMEOUT_MS)
-            page.wait_for_selector("#item-list .product-item", timeout=LIST_TIMEOUT_MS)
+            await page.goto(url, wait_until="domcontentloaded", timeout=NAV_TIMEOUT_MS)
+            await page.wait_for_selector("#item-list .product-item", timeout=LIST_TIMEOUT_MS)
             return True
+        except PlaywrightTimeoutError as e:
+            # 로딩 타임아웃은 일시적일 수 있으니 지수 백오프(+지터) 후 재시도
+            last_error = e
+            backoff = min(2 ** attempt, NAV_BACKOFF_CAP_SEC) + random.uniform(0, 0.5)
+            print(f"   ⚠️ 로딩 지연으로 재시도 {attempt}/{NAV_RETRIES} ({backoff:.1f}초 대기): {e}")
+            await asyncio.sleep(backoff)
         except Exception as e:
+            # net::ERR_* 같은 네트워크 단절은 재시도해도 소용없으니 바로 실패 처리
             last_error = e
-            print(f"   ⚠️ 로딩 지연으로 재시도 {attempt}/{NAV_RETRIES}: {e}")
-            time.sleep(2)
+            break
     print(f"   ❌ 페이지 로딩 실패: {last_error}")
     return False
 
 # ==========================================
-# 3. 메인 실행 함수
+# 3. 수집 로직 (컨텍스트 단위)
 # ==========================================
-def run():
+async def crawl_target_url(page, target_url, executor, sink):
+    """한 URL의 START_PAGE~MAX_PAGES 구간을 수집해 sink로 바로 흘려보냄."""
+    # 시작 페이지로 이동 (START_PAGE가 1이면 원본 URL, 아니면 ?page=N 추가)
+    if START_PAGE == 1:
+        start_url = target_url
+    else:
+        separator = "&" if "?" in target_url else "?"
+        start_url = f"{target_url}{separator}page={START_PAGE}"
+
+    print(f"\n📄 {START_PAGE}페이지로 이동 중...")
+    if not await navigate_and_wait(page, start_url):
+        print("   ❌ 페이지 로딩 실패, 다음 URL로 넘어갑니다.")
+        return
+
+    # 실제 수집 시작
+    for current_page in range(START_PAGE, MAX_PAGES + 1):
+        print(f"\n📄 {current_page}페이지 수집 중...")
+
+        # START_PAGE 이후 페이지는 다음 버튼 클릭으로 이동
+        if current_page > START_PAGE:
+            next_link = page.locator(".paging .paging-next-page a")
+            if await next_link.count() == 0:
+                print("   ⚠️ 다음 페이지 버튼이 없습니다. (마지막 페이지)")
+                break
+
+            current_first_id = ""
+            first_item = page.locator("#item-list .product-item").first
+            if await first_item.count() > 0:
+                current_first_id = await first_item.get_attribute("data-ratid") or ""
+
+            await next_link.first.click()
+
+            # 1초 단위 폴링 대신 첫 상품의 data-ratid가 바뀌는 즉시 반환
+            try:
+                await page.wait_for_function(
+                    "(prev) => {"
+                    " const el = document.querySelector('#item-list .product-item');"
+                    " return !!(el && el.dataset.ratid && el.dataset.ratid !== prev);"
+                    " }",
+                    arg=current_first_id,
+                    timeout=15000,
+                )
+            except Exception:
+                print("   ❌ 페이지 전환 실패 (타임아웃)")
+                break
+
+        await asyncio.sleep(1) # 렌더링 안정화 대기
+
+        # 상품 리스트 + 카테고리 찾기 (브라우저 안에서 한 번에 처리)
+        page_data = await page.evaluate(EXTRACT_PAGE_JS)
+        raw_items = page_data.get("items") or []
+        count = len(raw_items)
+
+        # --- 카테고리 정제 ---
+        category = "Unknown"
+        raw_cat = page_data.get("category") or ""
+        if raw_cat:
+            category = _CAT_RE.sub('', clean_text(raw_cat)).strip() or "Unknown"
+        print(f"   -> {count}개 상품 발견 (카테고리: {category})")
+
+        if count == 0:
+            print("   ⚠️ 상품이 없습니다. (페이지 끝 도달 가능성)")
+            break
+
+        # --- 상품 순회 (정제는 파이썬에서) ---
+        download_futures = []
+        for i, raw in enumerate(raw_items):
+            try:
+                # 1. 기본 정보
+                maker = clean_text(raw.get("maker"))
+                name = clean_text(raw.get("name"))
+                price = _PRICE_RE.sub('', raw.get("price") or "")
+
+                # 2. ID 추출
+                item_id = raw.get("id")
+                href = raw.get("url") or ""
+                if not item_id:
+                    match = _ITEM_ID_RE.search(href)
+                    item_id = match.group(1) if match else f"unknown_{i}"
+
+                # 3. 제품 URL
+                product_url = ""
+                if href:
+                    if href.startswith("/"):
+                        product_url = f"https://sm.rakuten.co.jp{href}"
+                    else:
+                        product_url = href
+
+                # 4. 이미지 URL
+                final_img_url = get_high_res_url(raw.get("img"))
+
+                # 데이터 저장 (메모리에 쌓지 않고 바로 파일로 기록)
+                product_data = {
+                    "id": item_id,
+                    "category": category,
+                    "maker": maker,
+                    "name": name,
+                    "price": int(price) if price else 0,
+                    "product_url": product_url,
+                    "image_url": final_img_url,
+                    "page": current_page,
+                    "source_url": target_url
+                }
+                sink(product_data)
+
+                print(f"   [{i+1}/{count}] {item_id} | {name[:10]}... | {category}")
+
+                # 이미지 다운로드
+                if final_img_url:
+                    safe_name = _FN_SAFE_RE.sub("", name).replace(" ", "_")
+                    safe_maker = _FN_SAFE_RE.sub("", maker).replace(" ", "_")
+                    ext = ".png" if ".png" in final_img_url else ".jpg"
+                    filename = f"{item_id}_{safe_maker}_{safe_name[:20]}{ext}"
+                    download_futures.append(
+                        asyncio.wrap_future(
+                            executor.submit(download_image, final_img_url, filename)
+                        )
+                    )
+
+            except Exception as e:
+                print(f"   ❌ {i}번 에러: {e}")
+                continue
+
+        # 다음 페이지로 넘어가기 전에 이 페이지 이미지 다운로드 완료 대기
+        if download_futures:
+            await asyncio.gather(*download_futures)
+
+
+async def crawl_shard(browser, urls, shard_idx, total_urls, executor, sink):
+    """컨텍스트 하나가 자기 몫의 URL들을 순서대로 수집."""
+    context = await browser.new_context(
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+        viewport={"width": 1920, "height": 1080},
+        locale="ja-JP",
+        timezone_id="Asia/Tokyo",
+    )
+    # async with로 감싸서 에러가 나도 컨텍스트가 확실히 정리되게 함 (메모리 누수 방지)
+    async with context:
+        await context.add_init_script(STEALTH_INIT_SCRIPT)
+        page = await context.new_page()
+        await page.route("**/*", _block_heavy_resources)
+
+        for target_url in urls:
+            print(f"\n==========================================")
+            print(f"🌍 [컨텍스트 {shard_idx+1}] 타겟 URL 처리 중... (전체 {total_urls}개)")
+            print(f"🔗 {target_url}")
+            print(f"==========================================")
+            await crawl_target_url(page, target_url, executor, sink)
+
+# ==========================================
+# 4. 메인 실행 함수
+# ==========================================
+async def run_async():
+    # 전체 크롤 실행 시간 데드라인 설정
+    global _deadline
+    _deadline = time.monotonic() + CRAWL_BUDGET_SEC
+
     # URL 인자 처리
     target_urls = sys.argv[1:]
     if not target_urls:
         print("ℹ️ 입력된 URL이 없어 기본 라면 카테고리를 수집합니다.")
         target_urls = [DEFAULT_URL]
-    
+
     print(f"🚀 Rakuten Seiyu 크롤러 v7.0 시작... (총 {len(target_urls)}개 URL)")
     print(f"📄 수집 구간: {START_PAGE}페이지 ~ {MAX_PAGES}페이지")
     print(f"📁 저장 파일명: {DATA_FILE}")
 
-    with sync_playwright() as p:
-        # Stealth 모드: 봇 감지 우회를 위한 설정
-        browser = p.chromium.launch(
-            headless=False,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--disable-dev-shm-usage",
-                "--no-sandbox",
-            ]
-        )
-        context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-            viewport={"width": 1920, "height": 1080},
-            locale="ja-JP",
-            timezone_id="Asia/Tokyo",
-        )
-        
-        # navigator.webdriver를 false로 설정 (봇 감지 우회 핵심)
-        context.add_init_script("""
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-            Object.defineProperty(navigator, 'plugins', {
-                get: () => [1, 2, 3, 4, 5]
-            });
-            Object.defineProperty(navigator, 'languages', {
-                get: () => ['ja-JP', 'ja', 'en-US', 'en']
-            });
-            window.chrome = { runtime: {} };
-        """)
-        
-        page = context.new_page()
-
-        all_products_total = []
-
-        # --- 입력된 URL 순회 ---
-        for url_idx, target_url in enumerate(target_urls):
-            print(f"\n==========================================")
-            print(f"🌍 [{url_idx+1}/{len(target_urls)}] 타겟 URL 처리 중...")
-            print(f"🔗 {target_url}")
-            print(f"==========================================")
-            
-            # 시작 페이지로 이동 (START_PAGE가 1이면 원본 URL, 아니면 ?page=N 추가)
-            if START_PAGE == 1:
-                start_url = target_url
-            else:
-                separator = "&" if "?" in target_url else "?"
-                start_url = f"{target_url}{separator}page={START_PAGE}"
-            
-            print(f"\n📄 {START_PAGE}페이지로 이동 중...")
-            if not navigate_and_wait(page, start_url):
-                print("   ❌ 페이지 로딩 실패, 다음 URL로 넘어갑니다.")
-                continue
+    # 이미지 다운로드는 네트워크 대기가 대부분이라 스레드풀로 병렬 처리
+    executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+
+    # 상품을 메모리에 모으지 않고 수집 즉시 파일에 추가 기록
+    # (중간에 죽어도 그때까지 수집분은 남음, 메모리 사용량 일정)
+    saved_count = 0
+    out_f = open(DATA_FILE, "w", encoding="utf-8")
+    out_f.write("[\n")
+
+    def sink(product_data):
+        nonlocal saved_count
+        if saved_count:
+            out_f.write(",\n")
+        out_f.write(_json_dumps(product_data))
+        saved_count += 1
+
+    # 샤드 하나가 죽거나 Ctrl-C로 중단돼도 그때까지 수집분이
+    # 유효한 JSON 배열로 남도록 마무리는 finally에서 보장
+    try:
+        async with async_playwright() as p:
+            # Stealth 모드: 봇 감지 우회를 위한 설정
+            browser = await p.chromium.launch(
+                headless=False,
+                args=[
+                    "--disable-blink-features=AutomationControlled",
+                    "--disable-dev-shm-usage",
+                    "--no-sandbox",
+                ]
+            )
+            async with browser:
+                # URL을 컨텍스트 수만큼 쪼개서 병렬 수집
+                shard_count = min(CONTEXT_COUNT, len(target_urls))
+                shards = [target_urls[i::shard_count] for i in range(shard_count)]
+                await asyncio.gather(*[
+                    crawl_shard(browser, shard, idx, len(target_urls), executor, sink)
+                    for idx, shard in enumerate(shards)
+                ])
 
-            # 실제 수집 시작
-            for current_page in range(START_PAGE, MAX_PAGES + 1):
-                print(f"\n📄 {current_page}페이지 수집 중...")
-
-                # START_PAGE 이후 페이지는 다음 버튼 클릭으로 이동
-                if current_page > START_PAGE:
-                    next_link = page.locator(".paging .paging-next-page a")
-                    if next_link.count() == 0:
-                        print("   ⚠️ 다음 페이지 버튼이 없습니다. (마지막 페이지)")
-                        break
-                    
-                    current_first_id = ""
-                    first_item = page.locator("#item-list .product-item").first
-                    if first_item.count() > 0:
-                        current_first_id = first_item.get_attribute("data-ratid") or ""
-                    
-                    next_link.first.click()
-                    
-                    page_changed = False
-                    for wait_sec in range(15):
-                        time.sleep(1)
-                        new_first_item = page.locator("#item-list .product-item").first
-                        if new_first_item.count() > 0:
-                            new_first_id = new_first_item.get_attribute("data-ratid") or ""
-                            if new_first_id and new_first_id != current_first_id:
-                                page_changed = True
-                                break
-                        print(f"   ⏳ 페이지 로딩 대기... {wait_sec+1}초")
-                    
-                    if not page_changed:
-                        print("   ❌ 페이지 전환 실패 (타임아웃)")
-                        break
-
-                time.sleep(1) # 렌더링 안정화 대기
-
-                # 스크롤 (이미지 로딩 트리거)
-                page.mouse.wheel(0, 4000)
-                time.sleep(1)
-
-                # --- 카테고리 추출 ---
-                category = "Unknown"
-                try:
-                    cat_el = page.locator('xpath=//*[@id="container"]/div[1]/div/div/div[3]/h1')
-                    if cat_el.count() > 0:
-                        raw_cat = clean_text(cat_el.first.inner_text())
-                        category = re.sub(r'\s*\d+～\d+件.*', '', raw_cat).strip()
-                except Exception:
-                    pass
-
-                # 상품 리스트 찾기
-                products = page.locator("#item-list .product-item:not(.product-item-next)")
-                count = products.count()
-                print(f"   -> {count}개 상품 발견 (카테고리: {category})")
-
-                if count == 0:
-                    print("   ⚠️ 상품이 없습니다. (페이지 끝 도달 가능성)")
-                    break
-
-                # --- 상품 순회 ---
-                for i in range(count):
-                    try:
-                        item = products.nth(i)
-                        
-                        # 1. 기본 정보
-                        maker_el = item.locator(".product-item-info-maker")
-                        maker = clean_text(maker_el.inner_text()) if maker_el.count() > 0 else "Unknown"
-
-                        name_el = item.locator(".product-item-info-name")
-                        name = clean_text(name_el.inner_text()) if name_el.count() > 0 else "Unknown"
-
-                        price_el = item.locator(".product-item-info-price")
-                        price_text = price_el.inner_text() if price_el.count() > 0 else "0"
-                        price = re.sub(r'[^0-9]', '', price_text)
-
-                        # 2. ID 추출
-                        item_id = item.get_attribute("data-ratid")
-                        if not item_id:
-                            link_el = item.locator("a").first
-                            href = link_el.get_attribute("href")
-                            match = re.search(r'/item/(\d+)', href)
-                            item_id = match.group(1) if match else f"unknown_{i}"
-
-                        # 3. 제품 URL
-                        product_url = ""
-                        link_el = item.locator("a").first
-                        if link_el.count() > 0:
-                            href = link_el.get_attribute("href")
-                            if href:
-                                if href.startswith("/"):
-                                    product_url = f"https://sm.rakuten.co.jp{href}"
-                                else:
-                                    product_url = href
-
-                        # 4. 이미지 URL
-                        img_el = item.locator("img.img-base-size")
-                        raw_img_url = ""
-                        if img_el.count() > 0:
-                            raw_img_url = img_el.get_attribute("data-src") or img_el.get_attribute("src")
-                        
-                        final_img_url = get_high_res_url(raw_img_url)
-
-                        # 데이터 저장
-                        product_data = {
-                            "id": item_id,
-                            "category": category,
-                            "maker": maker,
-                            "name": name,
-                            "price": int(price) if price else 0,
-                            "product_url": product_url,
-                            "image_url": final_img_url,
-                            "page": current_page,
-                            "source_url": target_url
-                        }
-                        all_products_total.append(product_data)
-                        
-                        print(f"   [{i+1}/{count}] {item_id} | {name[:10]}... | {category}")
-
-                        # 이미지 다운로드
-                        if final_img_url:
-                            safe_name = re.sub(r'[\\/*?:"<>|]', "", name).replace(" ", "_")
-                            safe_maker = re.sub(r'[\\/*?:"<>|]', "", maker).replace(" ", "_")
-                            ext = ".png" if ".png" in final_img_url else ".jpg"
-                            filename = f"{item_id}_{safe_maker}_{safe_name[:20]}{ext}"
-                            download_image(final_img_url, filename)
-
-                    except Exception as e:
-                        print(f"   ❌ {i}번 에러: {e}")
-                        continue
-        
-        # 파일 저장
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(all_products_total, f, ensure_ascii=False, indent=4)
-        
         print(f"\n🎉 모든 작업 완료!")
-        print(f"   ✅ 총 데이터: {len(all_products_total)}개")
+    finally:
+        # 진행 중인 이미지 다운로드를 마저 끝내고 배열 닫기
+        executor.shutdown(wait=True)
+        out_f.write("\n]\n")
+        out_f.close()
+
+        print(f"   ✅ 총 데이터: {saved_count}개")
         print(f"   ✅ 파일명: {DATA_FILE}")
-        
-        browser.close()
+
+def run():
+    asyncio.run(run_async())
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()
@@ -3,6 +3,12 @@ import pandas as pd
 import os
 import json
 
+# orjson이 있으면 C 구현 파서 사용 (없어도 stdlib json으로 동작)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # ==========================================
 # 1. 설정 (내 환경에 맞게 수정)
 # ==========================================
@@ -14,57 +20,58 @@ OUTPUT_FILE = "metadata_view.csv"
 # ==========================================
 # 2. SQL 쿼리 (파일 안에 내장!)
 # ==========================================
-# 작성자님이 만드신 그 완벽한 쿼리를 여기에 넣었습니다.
+# key별 CASE 집계 11개를 전 행에 돌리는 대신, key/value를 그대로 가져와서
+# pandas에서 피벗합니다. (SQLite 쪽 부담이 훨씬 적음)
+KEY_COLUMNS = {
+    "name": "상품명",
+    "price": "가격",
+    "maker": "제조사",
+    "category": "카테고리",
+    "image_path": "이미지경로",
+    "product_url": "상품URL",
+    "image_hash": "이미지해시",
+    "created_at": "생성일",
+    "updated_at": "수정일",
+    "ocr_lines": "OCR내용",
+}
+
 QUERY = """
-SELECT 
+SELECT
     id,
-    MAX(CASE WHEN key = 'name' THEN string_value END) AS 상품명,
-    MAX(CASE WHEN key = 'price' THEN int_value END) AS 가격,
-    MAX(CASE WHEN key = 'maker' THEN string_value END) AS 제조사,
-    MAX(CASE WHEN key = 'category' THEN string_value END) AS 카테고리,
-    MAX(CASE WHEN key = 'image_path' THEN string_value END) AS 이미지경로,
-    MAX(CASE WHEN key = 'product_url' THEN string_value END) AS 상품URL,
-    MAX(CASE WHEN key = 'image_hash' THEN string_value END) AS 이미지해시,
-    MAX(CASE WHEN key = 'created_at' THEN string_value END) AS 생성일,
-    MAX(CASE WHEN key = 'updated_at' THEN string_value END) AS 수정일,
-    MAX(CASE WHEN key = 'ocr_lines' THEN string_value END) AS OCR내용
+    key,
+    COALESCE(string_value, CAST(int_value AS TEXT)) AS value
 FROM embedding_metadata
-GROUP BY id;
+WHERE key IN ('name', 'price', 'maker', 'category', 'image_path',
+              'product_url', 'image_hash', 'created_at', 'updated_at', 'ocr_lines');
 """
 
 
-def _normalize_ocr_value(value):
-    if value is None:
-        return ""
-    if not isinstance(value, str):
-        return str(value)
+def _join_texts(parsed):
+    if isinstance(parsed, list):
+        parts = []
+        for item in parsed:
+            if isinstance(item, dict):
+                line_text = item.get("text")
+                if line_text:
+                    parts.append(str(line_text))
+            elif isinstance(item, str):
+                parts.append(item)
+        return " | ".join(parts)
 
-    text = value.strip()
-    if not text:
-        return ""
+    if isinstance(parsed, dict):
+        line_text = parsed.get("text")
+        return str(line_text) if line_text else ""
 
-    if text.startswith("[") or text.startswith("{"):
-        try:
-            parsed = json.loads(text)
-        except Exception:
-            return value
+    return ""
 
-        if isinstance(parsed, list):
-            parts = []
-            for item in parsed:
-                if isinstance(item, dict):
-                    line_text = item.get("text")
-                    if line_text:
-                        parts.append(str(line_text))
-                elif isinstance(item, str):
-                    parts.append(item)
-            return " | ".join(parts)
 
-        if isinstance(parsed, dict):
-            line_text = parsed.get("text")
-            return str(line_text) if line_text else ""
-
-    return value
+def _parse_ocr_cell(text):
+    try:
+        if orjson is not None:
+            return _join_texts(orjson.loads(text))
+        return _join_texts(json.loads(text))
+    except Exception:
+        return text
 
 def run_export():
     print(f"📂 DB 읽는 중... ({DB_PATH})")
@@ -76,7 +83,12 @@ def run_export():
     try:
         # 1. DB 연결 (sqlite3로 직접 연결)
         conn = sqlite3.connect(DB_PATH)
-        
+
+        # key 조건 조회가 인덱스를 타도록 보장 (없을 때만 생성)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_em_key ON embedding_metadata(key)"
+        )
+
         # 2. 쿼리 실행 및 데이터프레임 변환
         df = pd.read_sql_query(QUERY, conn)
         conn.close()
@@ -86,8 +98,18 @@ def run_export():
             print("⚠️ 저장된 데이터가 없습니다.")
             return
 
+        # 행 단위 key/value를 상품 단위 표로 피벗 후 한국어 컬럼명 적용
+        df = df.pivot(index="id", columns="key", values="value")
+        df = df.reindex(columns=list(KEY_COLUMNS)).rename(columns=KEY_COLUMNS)
+        df = df.reset_index()
+
         if "OCR내용" in df.columns:
-            df["OCR내용"] = df["OCR내용"].apply(_normalize_ocr_value)
+            # JSON으로 시작하는 행만 골라 파싱하고, 나머지는 그대로 둠
+            # (행별 파이썬 디스패치를 파싱이 꼭 필요한 행으로 한정)
+            ocr_col = df["OCR내용"].fillna("").astype(str)
+            json_mask = ocr_col.str.strip().str.startswith(("[", "{"))
+            df["OCR내용"] = ocr_col
+            df.loc[json_mask, "OCR내용"] = ocr_col[json_mask].map(_parse_ocr_cell)
 
         # 4. CSV 파일로 저장 (엑셀에서 한글 안 깨지게 utf-8-sig 사용)
         df.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
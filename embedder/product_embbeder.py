@@ -1,6 +1,7 @@
 import os
 import json
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from PIL import Image
 from sentence_transformers import SentenceTransformer
@@ -11,6 +12,12 @@ os.environ.setdefault("FLAGS_use_onednn", "false")
 from paddleocr import PaddleOCR
 import chromadb
 
+# orjson이 있으면 C 구현 파서/직렬화 사용 (없어도 stdlib json으로 동작)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # ==========================================
 # 1. 설정 (Configuration)
 # ==========================================
@@ -20,12 +27,22 @@ DB_PATH = "./chroma_db"
 COLLECTION_NAME = "rakuten_products"
 DEBUG_OCR = True
 
+# CLIP 인코딩/업서트 배치 크기 (한 장씩 돌리면 GPU/CPU가 놀게 됨)
+BATCH_SIZE = 64
+
 def run_embedding():
     print("🚀 스마트 임베딩 시스템 가동 (중복 방지 & 이미지 검증 포함)...")
 
     # 1. DB 연결
+    # hnsw:space를 명시하지 않으면 l2(제곱 유클리드)로 인덱스가 만들어져서
+    # 검색 서버가 거리를 코사인 유사도로 바로 환산할 수 없음.
+    # 주의: 기존 l2 컬렉션에는 소급 적용되지 않으므로 chroma_db를 지우고
+    # 재임베딩해야 cosine 인덱스가 됨.
     client = chromadb.PersistentClient(path=DB_PATH)
-    collection = client.get_or_create_collection(name=COLLECTION_NAME)
+    collection = client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        metadata={"hnsw:space": "cosine"},
+    )
 
     # 2. 모델 로드
     print("📥 CLIP 모델 로딩 중...")
@@ -36,8 +53,12 @@ def run_embedding():
 
     # 3. JSON 데이터 로드
     try:
-        with open(JSON_FILE, 'r', encoding='utf-8') as f:
-            products = json.load(f)
+        if orjson is not None:
+            with open(JSON_FILE, 'rb') as f:
+                products = orjson.loads(f.read())
+        else:
+            with open(JSON_FILE, 'r', encoding='utf-8') as f:
+                products = json.load(f)
     except FileNotFoundError:
         print(f"❌ JSON 파일을 찾을 수 없습니다: {JSON_FILE}")
         return
@@ -70,23 +91,65 @@ def run_embedding():
 
     print(f"💾 현재 DB 저장된 상품 수(대상 기준): {len(existing_ids)}개")
 
-    # 배치 처리를 위한 임시 저장소
-    batch_ids = []
-    batch_embeddings = []
-    batch_metadatas = []
-    
     new_count = 0
     update_count = 0
     skip_count = 0
     error_count = 0
+    upserted_count = 0
+
+    # 배치 처리를 위한 임시 저장소: (id, 이미지, 메타데이터)
+    pending = []
+
+    def flush_pending():
+        """모아둔 이미지를 한 번의 배치 forward로 인코딩하고 바로 업서트."""
+        nonlocal upserted_count
+        if not pending:
+            return
+        vectors = model.encode(
+            [img for _, img, _ in pending],
+            batch_size=BATCH_SIZE,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        batch_ids = []
+        batch_embeddings = []
+        batch_metadatas = []
+        for (product_id, img, metadata), vector in zip(pending, vectors):
+            img.close()
+            batch_ids.append(product_id)
+            batch_embeddings.append(vector.tolist())
+            batch_metadatas.append(metadata)
+        collection.upsert(
+            ids=batch_ids,
+            embeddings=batch_embeddings,
+            metadatas=batch_metadatas
+        )
+        upserted_count += len(batch_ids)
+        pending.clear()
 
     # 4. 이미지 인덱스 생성 (O(이미지 수) 한 번만)
+    # scandir은 리스트를 통째로 만들지 않고, entry.path를 저장해 두면 join도 생략됨
     image_index = {}
-    for f_name in os.listdir(IMAGE_DIR):
-        if f_name.endswith('.jpg') or f_name.endswith('.png'):
-            product_id = f_name.split('_', 1)[0].split('.', 1)[0]
-            if product_id not in image_index:
-                image_index[product_id] = f_name
+    with os.scandir(IMAGE_DIR) as entries:
+        for entry in entries:
+            f_name = entry.name
+            if f_name.endswith(('.jpg', '.png')):
+                product_id = f_name.split('_', 1)[0].split('.', 1)[0]
+                if product_id not in image_index:
+                    image_index[product_id] = entry.path
+
+    # 이미지 해시를 스레드풀로 미리 계산
+    # (SHA-256은 hashlib 내부에서 GIL을 풀기 때문에 디스크 읽기와 겹쳐서 돌릴 수 있음)
+    hash_targets = [
+        (str(item['id']), image_index[str(item['id'])])
+        for item in products
+        if 'id' in item and str(item['id']) in image_index
+    ]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as hash_pool:
+        hash_by_id = dict(zip(
+            [pid for pid, _ in hash_targets],
+            hash_pool.map(_hash_file, [path for _, path in hash_targets]),
+        ))
 
     # 5. 데이터 순회
     debug_printed = 0
@@ -95,19 +158,32 @@ def run_embedding():
         
         # [체크 2] 이미지가 실제로 존재하는가?
         # JSON에는 파일명이 없으므로 ID로 시작하는 이미지 파일을 찾습니다.
-        image_filename = image_index.get(product_id)
-        
-        if not image_filename:
+        image_path = image_index.get(product_id)
+
+        if not image_path:
             # print(f"   ⚠️ 이미지 파일 없음 (Skip): {item['name']}")
             error_count += 1
             continue
 
-        image_path = os.path.join(IMAGE_DIR, image_filename)
-        image_hash = _hash_file(image_path)
+        image_hash = hash_by_id[product_id]
 
         try:
-            now_iso = datetime.now(timezone.utc).isoformat()
             existing_meta = existing_meta_by_id.get(product_id)
+            is_update = product_id in existing_ids
+
+            # 변경 없는 상품은 가장 먼저 걸러냄 (재실행 시 대부분이 여기 해당)
+            # 해시는 이미 계산돼 있으므로 JSON 필드 + 해시만 비교하면 됨
+            if is_update and existing_meta:
+                if (existing_meta.get("name") == item['name']
+                        and existing_meta.get("price") == item['price']
+                        and existing_meta.get("maker") == item['maker']
+                        and existing_meta.get("category") == item['category']
+                        and existing_meta.get("product_url") == item['product_url']
+                        and existing_meta.get("image_hash") == image_hash):
+                    skip_count += 1
+                    continue
+
+            now_iso = datetime.now(timezone.utc).isoformat()
             created_at = (existing_meta or {}).get("created_at") or now_iso
             metadata_base = {
                 "name": item['name'],
@@ -121,65 +197,31 @@ def run_embedding():
                 "updated_at": now_iso,
             }
 
-            if product_id in existing_ids:
-                changed = False
-                if existing_meta:
-                    compare_keys = [
-                        "name",
-                        "price",
-                        "maker",
-                        "category",
-                        "product_url",
-                        "image_hash",
-                    ]
-                    for key in compare_keys:
-                        if existing_meta.get(key) != metadata_base.get(key):
-                            changed = True
-                            break
-                else:
-                    changed = True
-
-                if not changed:
-                    skip_count += 1
-                    continue
-
-                # [체크 3] 이미지가 깨지지 않고 열리는가? (Validation)
-                with Image.open(image_path) as img:
-                    # 이미지를 모델이 이해할 수 있게 벡터로 변환
-                    vector = model.encode(img).tolist()
-
-                ocr_lines = _run_ocr(ocr, image_path)
-                if DEBUG_OCR:
-                    print(f"   🧪 OCR 디버그: {product_id} lines={len(ocr_lines)}")
-                    for line in ocr_lines[:3]:
-                        print(f"      - {line}")
-                    debug_printed += 1
-                metadata = dict(metadata_base)
-                metadata["ocr_lines"] = _serialize_ocr_lines(ocr_lines)
-
-                batch_ids.append(product_id)
-                batch_embeddings.append(vector)
-                batch_metadatas.append(metadata)
+            # [체크 3] 이미지가 깨지지 않고 열리는가? (Validation)
+            # 인코딩은 배치로 몰아서 하므로 여기서는 로드해서 검증만 함
+            img = Image.open(image_path)
+            img.load()
+
+            ocr_lines = _run_ocr(ocr, image_path)
+            if DEBUG_OCR:
+                print(f"   🧪 OCR 디버그: {product_id} lines={len(ocr_lines)}")
+                for line in ocr_lines[:3]:
+                    print(f"      - {line}")
+                debug_printed += 1
+            metadata = dict(metadata_base)
+            metadata["ocr_lines"] = _serialize_ocr_lines(ocr_lines)
+            # 검색 서버가 쿼리 시점에 JSON 파싱/소문자 변환을 안 하도록
+            # 임베딩 시점에 합쳐둔 소문자 전문도 같이 저장
+            metadata["ocr_text"] = _join_ocr_text(ocr_lines)
+
+            pending.append((product_id, img, metadata))
+            if len(pending) >= BATCH_SIZE:
+                flush_pending()
+
+            if is_update:
                 update_count += 1
                 print(f"   🔁 [갱신] {item['name'][:15]}... 업데이트됨")
             else:
-                # [체크 3] 이미지가 깨지지 않고 열리는가? (Validation)
-                with Image.open(image_path) as img:
-                    # 이미지를 모델이 이해할 수 있게 벡터로 변환
-                    vector = model.encode(img).tolist()
-
-                ocr_lines = _run_ocr(ocr, image_path)
-                if DEBUG_OCR:
-                    print(f"   🧪 OCR 디버그: {product_id} lines={len(ocr_lines)}")
-                    for line in ocr_lines[:3]:
-                        print(f"      - {line}")
-                    debug_printed += 1
-                metadata = dict(metadata_base)
-                metadata["ocr_lines"] = _serialize_ocr_lines(ocr_lines)
-
-                batch_ids.append(product_id)
-                batch_embeddings.append(vector)
-                batch_metadatas.append(metadata)
                 new_count += 1
                 print(f"   ✅ [신규] {item['name'][:15]}... 추가됨")
 
@@ -188,14 +230,10 @@ def run_embedding():
             error_count += 1
             continue
 
-    # 5. DB에 저장 (신규/갱신 데이터가 있을 때만)
-    if batch_ids:
-        print(f"\n📥 신규/갱신 데이터 {len(batch_ids)}개를 DB에 저장합니다...")
-        collection.upsert(
-            ids=batch_ids,
-            embeddings=batch_embeddings,
-            metadatas=batch_metadatas
-        )
+    # 5. 남은 배치 저장
+    flush_pending()
+    if upserted_count:
+        print(f"\n📥 신규/갱신 데이터 {upserted_count}개를 DB에 저장했습니다.")
         print("🎉 저장 완료!")
     else:
         print("\n✨ 추가할 신규 데이터가 없습니다.")
@@ -274,17 +312,26 @@ def _serialize_ocr_lines(lines: list) -> str:
     if not lines:
         return ""
     try:
+        if orjson is not None:
+            return orjson.dumps(lines).decode("utf-8")
         return json.dumps(lines, ensure_ascii=False)
     except Exception:
         return ""
 
 
+def _join_ocr_text(lines: list) -> str:
+    if not lines:
+        return ""
+    return " ".join(
+        str(line.get("text")) for line in lines
+        if isinstance(line, dict) and line.get("text")
+    ).lower()
+
+
 def _hash_file(file_path: str) -> str:
-    hasher = hashlib.sha256()
+    # file_digest는 OpenSSL 버퍼 경로를 타서 청크 단위 update보다 빠름 (3.11+)
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            hasher.update(chunk)
-    return hasher.hexdigest()
+        return hashlib.file_digest(f, "sha256").hexdigest()
 
 
 if __name__ == "__main__":
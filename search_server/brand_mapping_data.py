@@ -1,5 +1,7 @@
 # brand_data.py
 # 공식적인 제조사 명칭 및 브랜드 매핑 데이터
+import functools
+
 # Key: 사용자가 입력할 수 있는 다양한 키워드 (소문자 영어, 한국어, 브랜드명 등)
 # Value: DB에 실제로 저장된 'maker' 필드의 핵심 키워드 (일본어)
 
@@ -124,9 +126,14 @@ BRAND_MAPPING = {
     "마스모토": "桝元",
 }
 
+# 매핑 키는 전부 소문자여야 lower() 조회가 성립함
+assert all(key == key.lower() for key in BRAND_MAPPING), "BRAND_MAPPING 키는 소문자여야 합니다"
+
+
+@functools.lru_cache(maxsize=256)
 def get_official_maker_name(query: str):
     """
-    사용자 입력(영어, 한국어, 브랜드명)을 받아 
+    사용자 입력(영어, 한국어, 브랜드명)을 받아
     DB 검색용 일본어 제조사명(일부분)을 반환합니다.
     """
     if not query:
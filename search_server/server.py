@@ -1,8 +1,12 @@
 from brand_mapping_data import BRAND_MAPPING, get_official_maker_name
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional
 from PIL import Image
+import asyncio
+import functools
+from contextlib import asynccontextmanager
 import io
 import json
 import os
@@ -13,9 +17,42 @@ import numpy as np
 import uvicorn
 import traceback
 from pathlib import Path
-from scipy.spatial.distance import cosine
 from difflib import SequenceMatcher
 
+# cv2가 있으면 업로드 이미지 디코딩을 SIMD 가속 경로로 처리
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# pyahocorasick이 있으면 다중 패턴 검색을 DFA 한 번 순회로 처리
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# orjson이 있으면 C 구현 파서/직렬화 사용 (없어도 stdlib json으로 동작)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# numba가 있으면 점수 산식 루프를 JIT 컴파일 (없으면 순수 파이썬 루프)
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# rapidfuzz가 있으면 유사도 계산을 C 구현(비트 병렬 DP)으로 처리
+try:
+    from rapidfuzz import fuzz
+    from rapidfuzz import process as rf_process
+    from rapidfuzz.distance import Indel
+except ImportError:
+    fuzz = None
+    rf_process = None
+    Indel = None
+
 # ==========================================
 # 1. 설정 및 모델 로드
 # ==========================================
@@ -24,11 +61,34 @@ COLLECTION_NAME = "rakuten_products"
 RESPONSE_JSON_PATH = os.path.join(os.path.dirname(__file__), "response.json")
 DEBUG_SCORING = True
 DEBUG_SCORING_LIMIT = 5
+# 스코어링 경로는 모듈 로드 시점에 한 번만 결정 (python -O로 돌리면 디버그 경로 제거)
+_SCORING_DEBUG = __debug__ and DEBUG_SCORING
+# response.json 기록 여부 (view_search_results.py가 이 파일을 읽으므로
+# 디버그 스코어링과는 별개 플래그로 관리)
+WRITE_RESPONSE_JSON = True
+
+# CUDA GPU가 있으면 CLIP/OCR 추론을 GPU로 (없으면 기존 CPU 경로 그대로)
+try:
+    import torch
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+except ImportError:
+    DEVICE = "cpu"
 
 def similarity(a: str, b: str) -> float:
     """두 문자열의 유사도 계산 (0.0~1.0)"""
+    if fuzz is not None:
+        return fuzz.ratio(a.lower(), b.lower()) / 100.0
     return SequenceMatcher(None, a.lower(), b.lower()).ratio()
 
+
+def _length_compatible(len_a: int, len_b: int) -> bool:
+    """길이만으로 ratio 상한이 임계치 미달이면 비싼 유사도 계산을 생략.
+
+    ratio의 상한은 2*min(la,lb)/(la+lb)이므로, 이 값이 임계치보다 작으면
+    실제 비교를 돌려봐야 절대 통과할 수 없음.
+    """
+    return 2 * min(len_a, len_b) >= SIMILARITY_THRESHOLD * (len_a + len_b)
+
 def _load_env_file() -> None:
     env_path = Path(__file__).resolve().parent / ".env"
     if not env_path.exists():
@@ -97,133 +157,291 @@ def load_weights() -> dict:
 WEIGHTS = load_weights()
 SIMILARITY_THRESHOLD = WEIGHTS.get("similarity_threshold", 0.8)
 
-app = FastAPI(title="Mono-Log AI Server", description="이미지 중심 하이브리드 검색 엔진")
-
-# 모델은 첫 요청 시 로드 (lazy loading)
+# 모델/DB 핸들 (서버 기동 시 lifespan에서 채워짐)
 model = None
 ocr = None
 client = None
 collection = None
+# 컬렉션이 cosine 인덱스인지 여부 (기동 시 확인; l2 구버전 DB면 False)
+_cosine_space = False
 
 def initialize_models():
-    """모델 초기화 (첫 요청 시 한 번만 실행)"""
-    global model, ocr, client, collection
+    """모델 초기화 (서버 기동 시 한 번만 실행)"""
+    global model, ocr, client, collection, _cosine_space, _extract_fn
     if model is None:
         print("⏳ 시스템 초기화 중...")
         import time
-        
+
         start = time.time()
-        model = SentenceTransformer('clip-ViT-B-32')
-        print(f"  ✓ CLIP 모델 로드: {time.time()-start:.2f}초")
-        
+        model = SentenceTransformer('clip-ViT-B-32', device=DEVICE)
+        print(f"  ✓ CLIP 모델 로드 ({DEVICE}): {time.time()-start:.2f}초")
+
         start = time.time()
-        ocr = PaddleOCR(use_textline_orientation=True, lang='japan')
-        print(f"  ✓ OCR 엔진 로드: {time.time()-start:.2f}초")
-        
+        # 상품 사진은 대부분 정방향이라 방향 분류 패스는 생략 (NN 한 번 덜 돎)
+        # Paddle은 장치 이름이 torch와 달라서 "cuda"가 아니라 "gpu"를 씀
+        paddle_device = "gpu" if DEVICE == "cuda" else "cpu"
+        try:
+            ocr = PaddleOCR(use_textline_orientation=False, lang='japan',
+                            device=paddle_device)
+        except Exception:
+            # 구버전 paddleocr는 device 인자가 없거나 장치 파싱에서 실패할 수 있음
+            ocr = PaddleOCR(use_textline_orientation=False, lang='japan')
+        print(f"  ✓ OCR 엔진 로드 ({paddle_device}): {time.time()-start:.2f}초")
+
+        # 더미 추론으로 결과 타입을 확인해 전용 텍스트 추출기를 바인딩
+        # (요청마다 isinstance/hasattr 디스패치를 반복하지 않도록)
+        try:
+            sample = ocr.predict(input=np.zeros((32, 32, 3), dtype=np.uint8))
+            if sample:
+                _extract_fn = _select_extractor(sample[0])
+        except Exception:
+            _extract_fn = _extract_texts
+
         start = time.time()
         client = chromadb.PersistentClient(path=DB_PATH)
         collection = client.get_collection(name=COLLECTION_NAME)
+        # 거리 메트릭 확인: cosine 인덱스면 1 - 거리가 곧 유사도지만,
+        # hnsw:space 지정 없이 만든 구버전 l2 인덱스는 그 환산이 성립 안 함
+        _cosine_space = (collection.metadata or {}).get("hnsw:space") == "cosine"
+        if not _cosine_space:
+            print("  ⚠️ 컬렉션이 l2 인덱스입니다. 재임베딩 전까지는 임베딩을 받아"
+                  " 코사인 유사도를 직접 계산합니다.")
         print(f"  ✓ DB 연결: {time.time()-start:.2f}초")
-        
+
         print("✅ 서버 준비 완료!")
 
+
+@asynccontextmanager
+async def lifespan(app):
+    # 첫 요청이 수 초짜리 모델 로드를 떠안지 않도록 기동 시점에 전부 로드
+    # (로드 실패 시 서버가 바로 죽어서 문제를 조기에 드러냄)
+    await asyncio.to_thread(initialize_models)
+    yield
+
+
+app = FastAPI(
+    title="Mono-Log AI Server",
+    description="이미지 중심 하이브리드 검색 엔진",
+    lifespan=lifespan,
+)
+
+# 응답 직렬화: orjson이 있으면 Rust 인코더 경로 (없으면 기본 JSONResponse)
+_RESPONSE_CLASS = ORJSONResponse if orjson is not None else JSONResponse
+
 # ==========================================
 # 2. 핵심 로직: 가중치 계산 함수
 # ==========================================
-def calculate_final_score(item, user_inputs, detected_texts=None):
-    # 1. 기본 점수: 이미지 벡터 유사도 (0.0 ~ 1.0)
-    base_score = item['similarity_score']
-    
-    # 2. 가중치 점수 합산
+def build_text_matcher(detected_texts):
+    """감지 단어 중 하나라도 포함되면 그 단어를 반환하는 매처를 생성.
+
+    요청당 한 번 만들어 두면 후보마다 단어 수만큼 substring 검색을 반복하는
+    대신 텍스트 한 번 순회로 끝남 (ahocorasick 없으면 기존 방식으로 동작).
+    """
+    words = [w for w in detected_texts if len(w) >= 2]
+    if not words:
+        return lambda text: None
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for word in words:
+            automaton.add_word(word, word)
+        automaton.make_automaton()
+
+        def match(text):
+            for _, word in automaton.iter(text):
+                return word
+            return None
+        return match
+
+    def match(text):
+        for word in words:
+            if word in text:
+                return word
+        return None
+    return match
+
+
+def _int_or_zero(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _price_bonus_arrays(metadatas, user_price):
+    """가격 일치율/보너스를 후보 전체에 대해 NumPy로 한 번에 계산."""
+    n = len(metadatas)
+    ratios = np.full(n, 100.0)
+    if not user_price:
+        return ratios, np.zeros(n)
+    try:
+        target_price = int(user_price)
+    except (TypeError, ValueError):
+        return ratios, np.zeros(n)
+
+    if target_price > 0:
+        prices = np.array([_int_or_zero(m.get('price', 0)) for m in metadatas])
+        ratios = np.abs(prices - target_price) / target_price * 100.0
+    bonuses = np.where(
+        ratios <= WEIGHTS["price_threshold_10pct"],
+        WEIGHTS["price_bonus_10pct"],
+        np.where(
+            ratios <= WEIGHTS["price_threshold_20pct"],
+            WEIGHTS["price_bonus_20pct"],
+            0.0,
+        ),
+    )
+    return ratios, bonuses
+
+
+@functools.lru_cache(maxsize=65536)
+def _parsed_ocr_tokens(item_id, raw):
+    """구버전 ocr_lines JSON을 토큰 튜플로 파싱.
+
+    같은 상품 행은 요청이 바뀌어도 raw가 동일하므로 LRU 캐시로
+    파싱 비용을 고유 상품 수만큼으로 줄임 (ocr_text가 있는 신버전
+    데이터는 애초에 이 경로를 타지 않음).
+    """
+    if not raw:
+        return ()
+    tokens = []
+    try:
+        parsed = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        for line in parsed:
+            if isinstance(line, dict) and 'text' in line:
+                tokens.extend(line['text'].split())
+    except Exception:
+        return ()
+    return tuple(tokens)
+
+
+def prep_items(ids, metadatas):
+    """후보 메타데이터에서 스코어링에 반복 사용되는 파생값을 한 번만 계산."""
+    prepped = []
+    for item_id, meta in zip(ids, metadatas):
+        name = meta.get('name', '') or ''
+        maker = meta.get('maker', '') or ''
+        db_tokens = name.split() + maker.split()
+        # 임베딩 시점에 미리 합쳐둔 소문자 전문이 있으면 JSON 파싱 생략
+        ocr_text = meta.get('ocr_text')
+        if ocr_text:
+            db_tokens.extend(ocr_text.split())
+        else:
+            # 구버전 데이터: ocr_lines JSON 문자열 파싱 (요청 간 캐시됨)
+            db_tokens.extend(_parsed_ocr_tokens(item_id, meta.get('ocr_lines')))
+        prepped.append({
+            "name": name,
+            "name_lower": name.lower(),
+            "maker": maker,
+            # bytes 포함 검사가 str보다 빠름 (멀티 코드포인트 로직 없는 C fastsearch)
+            "name_bytes": name.encode("utf-8"),
+            "maker_bytes": maker.encode("utf-8"),
+            "db_token_set": set(w.lower() for w in db_tokens if w),
+        })
+    return prepped
+
+
+def calculate_bonus_score(item, user_inputs, detected=None, pre=None):
+    """후보 하나의 보너스 점수 합만 계산.
+
+    문자열 매칭이 필요한 부분만 여기서 처리하고, base 점수와 섞어
+    정규화하는 순수 산술은 _score_batch가 후보 전체를 한 번에 처리함.
+    """
+    # 후보 50개 x 요청당 반복되는 전역 dict 조회를 지역 변수로 끌어내림
+    # (LOAD_FAST가 LOAD_GLOBAL + dict 조회보다 싸다)
+    W = WEIGHTS
+    brand_bonus = W["brand_bonus"]
+    name_bonus = W["name_bonus"]
+
     bonus_score = 0.0
-    
+
     # [필터 1] 브랜드 (가장 강력한 힌트)
     brand_matched = False
-    user_brand = user_inputs.get('brand')
-    if user_brand:
-        # 입력값을 소문자로 바꾸고, 매핑된 일본어가 있으면 가져옴
-        target_maker_keyword = get_official_maker_name(user_brand)
-        
-        # DB의 제조사(maker) 정보와 비교 (부분 일치)
+    # 매핑된 일본어 제조사명은 요청당 한 번만 계산해서 user_inputs로 전달받음
+    target_maker_keyword = user_inputs.get('target_maker')
+    if target_maker_keyword:
+        # DB의 제조사(maker)와의 부분 일치 여부는 벡터화 사전 계산 결과 사용
         # 예: 'nissin' -> '日清' 반환 -> DB의 '日清食品'에 포함되므로 OK!
-        if target_maker_keyword in item.get('maker', ''):
-            bonus_score += WEIGHTS["brand_bonus"]
+        if pre["brand_exact"]:
+            bonus_score += brand_bonus
             brand_matched = True
     
     # [필터 1-2] OCR에서 브랜드명 발견 (user_brand 없어도 작동)
-    if not brand_matched and detected_texts:
-        detected_full = ' '.join(detected_texts)
-        item_maker = item.get('maker', '')
-        # 완전 일치 체크
-        if item_maker and item_maker in detected_full:
-            bonus_score += WEIGHTS["brand_bonus"]
+    if not brand_matched and detected["texts"]:
+        item_maker = pre["maker"]
+        # 완전 일치 체크 (제품명과 동일하게 요청당 1회 생성한 매처 재사용)
+        if item_maker and (pre["maker_bytes"] in detected["full_bytes"] or
+                           user_inputs['detected_matcher'](item_maker) is not None):
+            bonus_score += brand_bonus
             brand_matched = True
         # 유사도 체크 (OCR 오류 대응: HISSIN vs NISSIN)
-        elif item_maker:
-            for word in detected_texts:
-                if len(word) >= 3 and similarity(word, item_maker) >= SIMILARITY_THRESHOLD:
-                    bonus_score += WEIGHTS["brand_bonus"]
+        # 제조사가 너무 짧거나 비교할 감지 단어가 없으면 루프 자체를 생략
+        elif len(item_maker) >= 3 and detected["fuzzy_words"]:
+            maker_len = len(item_maker)
+            for word, word_len in detected["fuzzy_words"]:
+                if (_length_compatible(word_len, maker_len)
+                        and similarity(word, item_maker) >= SIMILARITY_THRESHOLD):
+                    bonus_score += brand_bonus
                     brand_matched = True
                     break
 
     # [필터 2] 제품명 (name 파라미터 또는 OCR 자동 감지)
     name_matched = False
-    user_name = user_inputs.get('name')
-    if user_name:
-        # API name 입력: DB name에 포함되는지 확인
-        if user_name.lower() in item.get('name', '').lower():
-            bonus_score += WEIGHTS["name_bonus"]
+    user_name_lower = user_inputs.get('name_lower')
+    if user_name_lower:
+        # API name 입력: DB name 포함 여부는 벡터화 사전 계산 결과 사용
+        if pre["name_exact"]:
+            bonus_score += name_bonus
             name_matched = True
     
     # OCR에서 제품명 자동 감지
-    if not name_matched and detected_texts:
-        detected_full = ' '.join(detected_texts)
-        item_name = item.get('name', '')
-        # 완전 일치 체크
-        if item_name and (item_name in detected_full or 
-                          any(word in item_name for word in detected_texts if len(word) >= 2)):
-            bonus_score += WEIGHTS["name_bonus"]
+    if not name_matched and detected["texts"]:
+        item_name = pre["name"]
+        # 완전 일치 체크 (단어 포함 여부는 요청당 1회 생성한 매처로 확인)
+        if item_name and (pre["name_bytes"] in detected["full_bytes"] or
+                          user_inputs['detected_matcher'](item_name) is not None):
+            bonus_score += name_bonus
             name_matched = True
         # 유사도 체크 (OCR 오류 대응)
-        elif item_name:
-            for word in detected_texts:
-                if len(word) >= 3 and similarity(word, item_name) >= SIMILARITY_THRESHOLD:
-                    bonus_score += WEIGHTS["name_bonus"]
+        elif len(item_name) >= 3 and detected["fuzzy_words"]:
+            name_len = len(item_name)
+            for word, word_len in detected["fuzzy_words"]:
+                if (_length_compatible(word_len, name_len)
+                        and similarity(word, item_name) >= SIMILARITY_THRESHOLD):
+                    bonus_score += name_bonus
                     name_matched = True
                     break
 
-    # [필터 3] 가격 (비슷하면 점수)
-    user_price = user_inputs.get('price')
-    if user_price:
-        try:
-            target_price = int(user_price)
-            item_price = int(item.get('price', 0))
-            diff = abs(target_price - item_price)
-            price_ratio = (diff / target_price * 100) if target_price > 0 else 100
-            if price_ratio <= WEIGHTS["price_threshold_10pct"]:
-                bonus_score += WEIGHTS["price_bonus_10pct"]
-            elif price_ratio <= WEIGHTS["price_threshold_20pct"]:
-                bonus_score += WEIGHTS["price_bonus_20pct"]
-        except:
-            pass
+    # [필터 3] 가격 (후보 전체에 대해 미리 벡터 계산된 보너스)
+    bonus_score += pre["price_bonus"]
 
     # [필터 4] OCR 일치율 (업로드 이미지 OCR과 DB ocr_lines 비교)
-    if detected_texts:
-        _, ocr_bonus = _calculate_ocr_match_score(detected_texts, item, debug_ocr=False)
+    if detected["texts"]:
+        _, ocr_bonus = _calculate_ocr_match_score(detected, pre, debug_ocr=False)
         bonus_score += ocr_bonus
 
+    return bonus_score
+
+
+def _score_batch_py(base, bonus, base_weight, max_possible):
     # 정규화: 0~1 범위로 변환
     # 최대 가능 점수 = base(1.0) * BASE_WEIGHT + max_bonus * BONUS_WEIGHT
-    bonus_weight = 1.0 - WEIGHTS["base_score_weight"]
-    max_possible = 1.0 * WEIGHTS["base_score_weight"] + WEIGHTS["max_bonus"] * bonus_weight
-    
-    final_score = base_score * WEIGHTS["base_score_weight"] + bonus_score * bonus_weight
-    normalized_score = final_score / max_possible if max_possible > 0 else 0.0
-    
-    return min(normalized_score, 1.0)  # 1.0을 넘지 않도록
+    bonus_weight = 1.0 - base_weight
+    out = np.empty(base.shape[0])
+    for i in range(base.shape[0]):
+        score = (base[i] * base_weight + bonus[i] * bonus_weight) / max_possible
+        out[i] = score if score < 1.0 else 1.0  # 1.0을 넘지 않도록
+    return out
+
 
+if njit is not None:
+    # 후보별 산술 루프를 LLVM 네이티브 코드로 컴파일 (디스크 캐시로 재기동 비용 절감)
+    _score_batch = njit(cache=True, fastmath=True)(_score_batch_py)
+else:
+    _score_batch = _score_batch_py
 
-def calculate_score_with_debug(item, user_inputs, detected_texts=None, debug_ocr=False):
+
+def calculate_score_with_debug(item, user_inputs, detected=None, pre=None, debug_ocr=False):
     base_score = item['similarity_score']
     bonus_score = 0.0
     reasons = []
@@ -236,32 +454,32 @@ def calculate_score_with_debug(item, user_inputs, detected_texts=None, debug_ocr
     }
 
     brand_matched = False
-    user_brand = user_inputs.get('brand')
-    if user_brand:
-        target_maker_keyword = get_official_maker_name(user_brand)
-        if target_maker_keyword in item.get('maker', ''):
+    target_maker_keyword = user_inputs.get('target_maker')
+    if target_maker_keyword:
+        if pre["brand_exact"]:
             bonus_score += WEIGHTS["brand_bonus"]
             breakdown["brand"] = WEIGHTS["brand_bonus"]
             reasons.append(f"brand:+{WEIGHTS['brand_bonus']:.2f}({target_maker_keyword})")
             brand_matched = True
     
     # OCR에서 브랜드명 발견
-    if not brand_matched and detected_texts:
-        detected_full = ' '.join(detected_texts)
-        item_maker = item.get('maker', '')
+    if not brand_matched and detected["texts"]:
+        item_maker = pre["maker"]
         matched_word = None
         match_type = None
-        # 완전 일치
-        if item_maker and item_maker in detected_full:
+        # 완전 일치 (제품명과 동일하게 요청당 1회 생성한 매처 재사용)
+        contained_word = user_inputs['detected_matcher'](item_maker) if item_maker else None
+        if item_maker and (pre["maker_bytes"] in detected["full_bytes"] or contained_word is not None):
             bonus_score += WEIGHTS["brand_bonus"]
             breakdown["brand"] = WEIGHTS["brand_bonus"]
-            matched_word = item_maker
+            matched_word = contained_word or item_maker
             match_type = "exact"
             brand_matched = True
         # 유사도 체크
-        elif item_maker:
-            for word in detected_texts:
-                if len(word) >= 3:
+        elif len(item_maker) >= 3 and detected["fuzzy_words"]:
+            maker_len = len(item_maker)
+            for word, word_len in detected["fuzzy_words"]:
+                if _length_compatible(word_len, maker_len):
                     sim = similarity(word, item_maker)
                     if sim >= SIMILARITY_THRESHOLD:
                         bonus_score += WEIGHTS["brand_bonus"]
@@ -275,30 +493,30 @@ def calculate_score_with_debug(item, user_inputs, detected_texts=None, debug_ocr
 
     # 제품명 (name 파라미터 또는 OCR 자동 감지)
     name_matched = False
-    user_name = user_inputs.get('name')
-    if user_name:
-        if user_name.lower() in item.get('name', '').lower():
+    user_name_lower = user_inputs.get('name_lower')
+    if user_name_lower:
+        if pre["name_exact"]:
             bonus_score += WEIGHTS["name_bonus"]
             breakdown["name"] = WEIGHTS["name_bonus"]
-            reasons.append(f"name:+{WEIGHTS['name_bonus']:.2f}(API:{user_name})")
+            reasons.append(f"name:+{WEIGHTS['name_bonus']:.2f}(API:{user_inputs.get('name')})")
             name_matched = True
     
     # OCR에서 제품명 자동 감지
-    if not name_matched and detected_texts:
-        detected_full = ' '.join(detected_texts)
-        item_name = item.get('name', '')
+    if not name_matched and detected["texts"]:
+        item_name = pre["name"]
         matched_word = None
-        # 완전 일치
-        if item_name and (item_name in detected_full or 
-                          any(word in item_name for word in detected_texts if len(word) >= 2)):
+        # 완전 일치 (단어 포함 여부는 요청당 1회 생성한 매처로 확인)
+        contained_word = user_inputs['detected_matcher'](item_name) if item_name else None
+        if item_name and (pre["name_bytes"] in detected["full_bytes"] or contained_word is not None):
             bonus_score += WEIGHTS["name_bonus"]
             breakdown["name"] = WEIGHTS["name_bonus"]
-            matched_word = next((w for w in detected_texts if len(w) >= 2 and w in item_name), item_name[:10])
+            matched_word = contained_word or item_name[:10]
             name_matched = True
         # 유사도 체크
-        elif item_name:
-            for word in detected_texts:
-                if len(word) >= 3:
+        elif len(item_name) >= 3 and detected["fuzzy_words"]:
+            name_len = len(item_name)
+            for word, word_len in detected["fuzzy_words"]:
+                if _length_compatible(word_len, name_len):
                     sim = similarity(word, item_name)
                     if sim >= SIMILARITY_THRESHOLD:
                         bonus_score += WEIGHTS["name_bonus"]
@@ -309,30 +527,21 @@ def calculate_score_with_debug(item, user_inputs, detected_texts=None, debug_ocr
         if matched_word:
             reasons.append(f"name:+{WEIGHTS['name_bonus']:.2f}(OCR:{matched_word})")
 
-    # 가격
-    user_price = user_inputs.get('price')
-    if user_price:
-        try:
-            target_price = int(user_price)
-            item_price = int(item.get('price', 0))
-            diff = abs(target_price - item_price)
-            price_ratio = (diff / target_price * 100) if target_price > 0 else 100
-            if price_ratio <= WEIGHTS["price_threshold_10pct"]:
-                bonus_score += WEIGHTS["price_bonus_10pct"]
-                breakdown["price"] = WEIGHTS["price_bonus_10pct"]
-                reasons.append(f"price:+{WEIGHTS['price_bonus_10pct']:.2f}(<={WEIGHTS['price_threshold_10pct']:.0f}%)")
-            elif price_ratio <= WEIGHTS["price_threshold_20pct"]:
-                bonus_score += WEIGHTS["price_bonus_20pct"]
-                breakdown["price"] = WEIGHTS["price_bonus_20pct"]
-                reasons.append(f"price:+{WEIGHTS['price_bonus_20pct']:.2f}(<={WEIGHTS['price_threshold_20pct']:.0f}%)")
-        except Exception:
-            pass
+    # 가격 (후보 전체에 대해 미리 벡터 계산된 보너스)
+    if pre["price_bonus"] > 0:
+        bonus_score += pre["price_bonus"]
+        breakdown["price"] = pre["price_bonus"]
+        if pre["price_ratio"] <= WEIGHTS["price_threshold_10pct"]:
+            threshold = WEIGHTS["price_threshold_10pct"]
+        else:
+            threshold = WEIGHTS["price_threshold_20pct"]
+        reasons.append(f"price:+{pre['price_bonus']:.2f}(<={threshold:.0f}%)")
 
     # OCR 일치율 (업로드 이미지 vs DB 메타데이터)
-    if detected_texts:
+    if detected["texts"]:
         match_ratio, ocr_bonus = _calculate_ocr_match_score(
-            detected_texts,
-            item,
+            detected,
+            pre,
             debug_ocr=debug_ocr,
         )
         breakdown["ocr_ratio"] = match_ratio
@@ -361,15 +570,35 @@ def calculate_score_with_debug(item, user_inputs, detected_texts=None, debug_ocr
     return normalized_score, reasons, breakdown
 
 
-def _extract_texts(res):
-    if isinstance(res, dict):
-        texts = res.get("rec_texts") or res.get("texts")
-        if texts:
-            return list(texts)
-        if "text" in res:
-            return [res.get("text")]
-        return []
+# 백그라운드 기록 태스크의 강참조 보관용 (이벤트 루프는 태스크를 약참조로만
+# 들고 있어서, 여기에 안 잡아두면 실행 전에 GC될 수 있음)
+_background_tasks = set()
+
+
+def _write_response_json(payload):
+    """마지막 응답을 디버깅용 파일로 기록 (요청 경로 밖에서 호출됨)."""
+    try:
+        if orjson is not None:
+            with open(RESPONSE_JSON_PATH, "wb") as f:
+                f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+        else:
+            with open(RESPONSE_JSON_PATH, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, indent=2)
+    except Exception:
+        # 디버그 파일 기록 실패가 응답에 영향을 주면 안 됨
+        traceback.print_exc()
+
+
+def _extract_texts_dict(res):
+    texts = res.get("rec_texts") or res.get("texts")
+    if texts:
+        return list(texts)
+    if "text" in res:
+        return [res.get("text")]
+    return []
+
 
+def _extract_texts_obj(res):
     for attr in ("to_json", "json"):
         if hasattr(res, attr):
             try:
@@ -377,74 +606,98 @@ def _extract_texts(res):
                 return _extract_texts(data)
             except Exception:
                 pass
+    return []
+
+
+def _extract_texts_list(res):
+    texts = []
+    for line in res:
+        if isinstance(line, (list, tuple)) and len(line) >= 2:
+            payload = line[1]
+            if isinstance(payload, (list, tuple)) and len(payload) >= 1:
+                text = str(payload[0]).strip()
+                if text:
+                    texts.append(text)
+    return texts
 
+
+def _select_extractor(res):
+    """결과 객체의 모양을 보고 전용 추출기를 고름 (버전별로 고정)."""
+    if isinstance(res, dict):
+        return _extract_texts_dict
+    if hasattr(res, "to_json") or hasattr(res, "json"):
+        return _extract_texts_obj
     if isinstance(res, list):
-        texts = []
-        for line in res:
-            if isinstance(line, (list, tuple)) and len(line) >= 2:
-                payload = line[1]
-                if isinstance(payload, (list, tuple)) and len(payload) >= 1:
-                    text = str(payload[0]).strip()
-                    if text:
-                        texts.append(text)
-        return texts
+        return _extract_texts_list
+    return lambda _res: []
+
+
+def _extract_texts(res):
+    """타입을 모를 때 쓰는 범용 추출기 (기동 시 전용 추출기로 대체됨)."""
+    return _select_extractor(res)(res)
 
-    return []
 
+# 요청 처리에서 실제로 쓰는 추출기. PaddleOCR 결과 타입은 설치된 버전에서
+# 고정이므로 기동 시 더미 추론 한 번으로 디스패치를 미리 끝내둠.
+_extract_fn = _extract_texts
 
-def _calculate_ocr_match_score(detected_texts, item, debug_ocr=False):
+
+def _calculate_ocr_match_score(detected, pre, debug_ocr=False):
     """
     업로드 이미지의 OCR 텍스트와 DB 상품 정보(name, maker, ocr_lines)의 일치율 계산
     반환: (일치율%, 보너스 점수)
     """
-    # DB에서 텍스트 추출
-    db_texts = []
-    
-    # name과 maker 추가
-    if item.get('name'):
-        db_texts.extend(item['name'].split())
-    if item.get('maker'):
-        db_texts.extend(item['maker'].split())
-    
-    # ocr_lines 파싱 (JSON 문자열)
-    ocr_lines_str = item.get('ocr_lines', '[]')
-    try:
-        ocr_lines = json.loads(ocr_lines_str)
-        for line in ocr_lines:
-            if isinstance(line, dict) and 'text' in line:
-                db_texts.extend(line['text'].split())
-    except:
-        pass
-    
-    # 겹치는 단어 계산 (완전 일치 + 유사도)
-    detected_set = set(w.lower() for w in detected_texts if w)
-    db_set = set(w.lower() for w in db_texts if w)
-    
-    # 완전 일치
-    exact_overlap = detected_set & db_set
-    overlap_count = len(exact_overlap)
+    # 토큰 집합은 요청/후보별 prep 단계에서 미리 계산돼 있음
+    detected_set = detected["set"]
+    db_set = pre["db_token_set"]
+
+    # 완전 일치는 요청 핸들러에서 후보 전체를 벡터화해 계산해 둔 결과 사용
+    exact_overlap = pre["exact_overlap"]
+    overlap_count = pre["exact_overlap_count"]
     
-    # 유사도 매칭 (완전 일치 못한 것들끼리)
-    remaining_detected = detected_set - exact_overlap
-    remaining_db = db_set - exact_overlap
+    # 유사도 매칭 (완전 일치 못한 것들끼리, 너무 짧은 단어는 skip)
+    det_words = [w for w in detected_set - exact_overlap if len(w) >= 3]
+    db_words = [w for w in db_set - exact_overlap if len(w) >= 3]
     fuzzy_matches = []
-    
-    for det_word in remaining_detected:
-        if len(det_word) < 3:  # 너무 짧은 단어는 skip
-            continue
-        for db_word in remaining_db:
-            if len(db_word) < 3:
-                continue
-            sim = similarity(det_word, db_word)
-            if sim >= SIMILARITY_THRESHOLD:
-                fuzzy_matches.append((det_word, db_word, sim))
+
+    if det_words and db_words and rf_process is not None:
+        # NxM 유사도 행렬을 C에서 한 번에 계산한 뒤 행별 최고 매칭 선택
+        # (Indel은 64비트 레지스터에 패킹된 비트 병렬 DP라 짧은 토큰에 가장 빠름)
+        matrix = rf_process.cdist(
+            det_words,
+            db_words,
+            scorer=Indel.normalized_similarity,
+            score_cutoff=SIMILARITY_THRESHOLD,
+        )
+        used_cols = set()
+        for r, det_word in enumerate(det_words):
+            best_c = -1
+            best_score = 0.0
+            for c in range(len(db_words)):
+                if c not in used_cols and matrix[r][c] > best_score:
+                    best_score = matrix[r][c]
+                    best_c = c
+            if best_c >= 0:  # cutoff 미만은 행렬에서 0으로 깔림
+                fuzzy_matches.append((det_word, db_words[best_c], float(best_score)))
                 overlap_count += 1
-                remaining_db.discard(db_word)  # 중복 매칭 방지
-                break
+                used_cols.add(best_c)  # 중복 매칭 방지
+    else:
+        remaining_db = set(db_words)
+        for det_word in det_words:
+            det_len = len(det_word)
+            for db_word in remaining_db:
+                if not _length_compatible(det_len, len(db_word)):
+                    continue
+                sim = similarity(det_word, db_word)
+                if sim >= SIMILARITY_THRESHOLD:
+                    fuzzy_matches.append((det_word, db_word, sim))
+                    overlap_count += 1
+                    remaining_db.discard(db_word)  # 중복 매칭 방지
+                    break
     
     # 🔍 DEBUG: OCR 매칭 과정 출력
     if debug_ocr:
-        print(f"    🔍 OCR DEBUG for {item.get('name', 'Unknown')[:30]}")
+        print(f"    🔍 OCR DEBUG for {(pre['name'] or 'Unknown')[:30]}")
         print(f"       Detected: {list(detected_set)[:5]}... (total: {len(detected_set)})")
         print(f"       DB: {list(db_set)[:5]}... (total: {len(db_set)})")
         print(f"       Exact match: {exact_overlap}")
@@ -473,41 +726,76 @@ def _calculate_ocr_match_score(detected_texts, item, debug_ocr=False):
 # ==========================================
 # 3. 메인 API: 이미지 검색 (+ 필터)
 # ==========================================
-@app.post("/search/image")
+@app.post("/search/image", response_class=_RESPONSE_CLASS)
 async def search_by_image(
     file: UploadFile = File(...),      # 필수: 이미지 파일
     name: Optional[str] = Form(None),  # 선택: 제품명
     price: Optional[str] = Form(None), # 선택: 가격
-    brand: Optional[str] = Form(None)  # 선택: 브랜드
+    brand: Optional[str] = Form(None), # 선택: 브랜드
+    fast_mode: bool = Form(False)      # 선택: OCR 생략 (속도 우선)
 ):
-    # 모델 초기화 (첫 요청 시 한 번만)
-    initialize_models()
-    
     try:
-        # 1. 이미지 읽기
+        # 1. 이미지 읽기 - 한 번만 디코딩해서 OCR과 CLIP 양쪽에 공급
+        # (cv2가 있으면 libjpeg-turbo SIMD 디코더 사용, 없으면 PIL)
         image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data)).convert("RGB")
+        arr = None
+        if cv2 is not None:
+            decoded = cv2.imdecode(
+                np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR
+            )
+            if decoded is not None:
+                arr = cv2.cvtColor(decoded, cv2.COLOR_BGR2RGB)
+        if arr is not None:
+            image = Image.fromarray(arr)  # 복사 없는 래핑
+        else:
+            image = Image.open(io.BytesIO(image_data)).convert("RGB")
 
-        # 2. [정밀 모드] 업로드된 이미지 OCR 수행 (속도 희생, 정확도 UP)
-        ocr_result = ocr.predict(input=np.array(image))
-        detected_texts = []
-        for res in ocr_result:
-            detected_texts.extend(_extract_texts(res))
+        # 2+3. OCR과 CLIP 인코딩을 워커 스레드에서 동시에 수행
+        # (둘 다 내부에서 GIL을 풀기 때문에 실제로 겹쳐서 돌고,
+        #  이벤트 루프도 블로킹하지 않음)
+        # fast_mode이거나 brand+name 필터가 모두 있으면 OCR(최대 비용)을 생략
+        skip_ocr = fast_mode or bool(brand and name)
+        if skip_ocr:
+            ocr_result = []
+            query_vector = await asyncio.to_thread(model.encode, image)
+        else:
+            if arr is None:
+                arr = np.asarray(image)
+            ocr_result, query_vector = await asyncio.gather(
+                asyncio.to_thread(ocr.predict, input=arr),
+                asyncio.to_thread(model.encode, image),
+            )
+        query_vector = query_vector.tolist()
+
+        detected_texts = [t for res in ocr_result for t in _extract_fn(res)]
         full_ocr_text = " ".join(detected_texts)
-        
+
         print(f"📸 OCR 감지된 텍스트: {full_ocr_text}")
 
-        # 3. 이미지 벡터 변환
-        query_vector = model.encode(image).tolist()
+        # 감지 텍스트의 파생값(합친 전문, 소문자 토큰 집합)은 요청당 한 번만 계산
+        detected = {
+            "texts": detected_texts,
+            "full": full_ocr_text,
+            # 후보별 포함 검사는 UTF-8 bytes 버퍼에서 수행 (인코딩은 요청당 1회)
+            "full_bytes": full_ocr_text.encode("utf-8"),
+            "set": set(w.lower() for w in detected_texts if w),
+            # 유사도 루프 대상 단어(길이 필터 통과분)는 요청당 한 번만 추림
+            "fuzzy_words": [(w, len(w)) for w in detected_texts if len(w) >= 3],
+        }
 
         # 4. 1차 후보군 검색 (벡터로 상위 50개 가져옴 - 넉넉하게)
+        # l2 구버전 인덱스에서는 거리를 코사인으로 환산할 수 없어서
+        # 임베딩 본문을 받아 직접 계산해야 함 (cosine 인덱스면 생략)
+        include_fields = ["metadatas", "distances"]
+        if not _cosine_space:
+            include_fields.append("embeddings")
         results = collection.query(
             query_embeddings=[query_vector],
             n_results=50,
-            include=["metadatas", "distances", "embeddings"]
+            include=include_fields
         )
 
-        if DEBUG_SCORING:
+        if _SCORING_DEBUG:
             print(
                 "DEBUG query results:",
                 {
@@ -519,12 +807,19 @@ async def search_by_image(
 
         # 5. 2차 재순위화 (Re-ranking)
         candidates = []
-        user_inputs = {"name": name, "price": price, "brand": brand}
+        # 요청당 한 번만 계산하고 후보 50개 점수 계산에서 재사용
+        user_inputs = {
+            "name": name,
+            "price": price,
+            "brand": brand,
+            "name_lower": name.lower() if name else None,
+            "target_maker": get_official_maker_name(brand) if brand else None,
+            "detected_matcher": build_text_matcher(detected_texts),
+        }
         
         ids_list = results.get('ids', [])
         metas_list = results.get('metadatas', [])
         dists_list = results.get('distances', [])
-        embeddings_list = results.get('embeddings', [])
 
         if not ids_list or not ids_list[0]:
             return {
@@ -536,68 +831,162 @@ async def search_by_image(
         ids = ids_list[0]
         metadatas = metas_list[0] if metas_list else []
         distances = dists_list[0] if dists_list else []
-        embeddings = embeddings_list[0] if embeddings_list else []
 
-        if DEBUG_SCORING:
+        if _SCORING_DEBUG:
             print(
                 "DEBUG first batch sizes:",
                 {
                     "ids": len(ids),
                     "metadatas": len(metadatas),
                     "distances": len(distances),
-                    "embeddings": len(embeddings),
                 },
             )
 
-        debug_scored = 0
-        for item_id, meta, dist, embedding in zip(ids, metadatas, distances, embeddings):
+        # 후보별 파생값(소문자 이름, 토큰 집합, OCR 파싱 결과)은 한 번만 계산
+        item_preps = prep_items(ids, metadatas)
+
+        # 브랜드/제품명 완전 일치와 가격 보너스는 후보 전체를 NumPy로 한 번에 계산
+        n_candidates = len(metadatas)
+        makers_arr = np.array([p["maker"] for p in item_preps])
+        names_lower_arr = np.array([p["name_lower"] for p in item_preps])
+        if user_inputs['target_maker']:
+            brand_exact_arr = np.char.find(makers_arr, user_inputs['target_maker']) >= 0
+        else:
+            brand_exact_arr = np.zeros(n_candidates, dtype=bool)
+        if user_inputs['name_lower']:
+            name_exact_arr = np.char.find(names_lower_arr, user_inputs['name_lower']) >= 0
+        else:
+            name_exact_arr = np.zeros(n_candidates, dtype=bool)
+        price_ratios, price_bonuses = _price_bonus_arrays(metadatas, price)
+
+        # 벡터 유사도 (0~1 범위)
+        if _cosine_space:
+            # cosine 인덱스: Chroma가 돌려준 거리가 곧 1 - 코사인 유사도
+            sims = 1.0 - np.asarray(distances, dtype=np.float64)
+        else:
+            # l2 인덱스(구버전 DB): 임베딩을 받아 정규화 GEMV 한 번으로 계산
+            embeddings_list = results.get('embeddings')
+            embeddings = embeddings_list[0] if embeddings_list is not None and len(embeddings_list) else []
+            if len(embeddings):
+                emb = np.asarray(embeddings, dtype=np.float32)
+                emb = emb / (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-12)
+                q = np.asarray(query_vector, dtype=np.float32)
+                q = q / (np.linalg.norm(q) + 1e-12)
+                sims = emb @ q
+            else:
+                sims = np.zeros(len(ids), dtype=np.float64)
+
+        # OCR 토큰 완전 일치도 후보 50개 전체를 한 번에 계산
+        # (후보마다 파이썬 set 교집합을 도는 대신, 토큰을 평탄화해서
+        #  np.isin 해시 조회 1회 + 누적합 차분으로 후보별 개수를 뽑음)
+        per_item_tokens = [list(p["db_token_set"]) for p in item_preps]
+        token_offsets = np.concatenate(
+            ([0], np.cumsum([len(toks) for toks in per_item_tokens]))
+        )
+        flat_tokens = [tok for toks in per_item_tokens for tok in toks]
+        if flat_tokens and detected["set"]:
+            flat_arr = np.array(flat_tokens)
+            token_mask = np.isin(flat_arr, np.array(list(detected["set"])))
+            mask_cumsum = np.concatenate(([0], np.cumsum(token_mask)))
+            overlap_counts = mask_cumsum[token_offsets[1:]] - mask_cumsum[token_offsets[:-1]]
+        else:
+            flat_arr = np.empty(0, dtype=str)
+            token_mask = np.zeros(0, dtype=bool)
+            overlap_counts = np.zeros(n_candidates, dtype=np.int64)
+
+        # 준비 패스: 후보/파생값만 만들고, 점수 계산은 모듈 로드 시점에
+        # 결정된 경로(디버그/배치)가 루프 분기 없이 일괄 처리
+        pres = []
+        for i, (item_id, meta) in enumerate(zip(ids, metadatas)):
             item = meta
             item['id'] = item_id
-            # Cosine similarity (0~1 범위)
-            cosine_dist = cosine(query_vector, embedding)
-            item['similarity_score'] = 1 - cosine_dist
-            
-            # 여기서 가중치 계산! (detected_texts 포함)
-            if DEBUG_SCORING:
+            item['similarity_score'] = float(sims[i])
+
+            # 벡터 패스에서 나온 마스크 구간을 잘라 완전 일치 토큰 집합 복원
+            tok_start, tok_end = token_offsets[i], token_offsets[i + 1]
+            if overlap_counts[i]:
+                seg_mask = token_mask[tok_start:tok_end]
+                exact_overlap = set(flat_arr[tok_start:tok_end][seg_mask])
+            else:
+                exact_overlap = set()
+
+            pres.append({
+                "brand_exact": bool(brand_exact_arr[i]),
+                "name_exact": bool(name_exact_arr[i]),
+                "price_ratio": float(price_ratios[i]),
+                "price_bonus": float(price_bonuses[i]),
+                "exact_overlap": exact_overlap,
+                "exact_overlap_count": int(overlap_counts[i]),
+                **item_preps[i],
+            })
+            candidates.append(item)
+
+        if _SCORING_DEBUG:
+            debug_scored = 0
+            for item, pre in zip(candidates, pres):
                 final_score, reasons, breakdown = calculate_score_with_debug(
                     item,
                     user_inputs,
-                    detected_texts,
+                    detected,
+                    pre=pre,
                     debug_ocr=debug_scored < DEBUG_SCORING_LIMIT,
                 )
+                item['final_score'] = final_score
+
+                if debug_scored < DEBUG_SCORING_LIMIT:
+                    print("=" * 80)
+                    print(f"🔍 DEBUG [{debug_scored + 1}/{DEBUG_SCORING_LIMIT}] - {item.get('name', 'Unknown')}")
+                    print(f"📦 ID: {item['id']}")
+                    print(f"🏢 Maker: {item.get('maker', 'N/A')}")
+                    print(f"💰 Price: {item.get('price', 'N/A')}")
+                    print("-" * 80)
+                    print(f"📊 Base Score (벡터 유사도): {item['similarity_score']:.4f}")
+                    print(f"🎁 Bonus Breakdown:")
+                    print(f"   • Brand:   +{breakdown.get('brand', 0.0):.3f}")
+                    print(f"   • Name:    +{breakdown.get('name', 0.0):.3f}")
+                    print(f"   • Price:   +{breakdown.get('price', 0.0):.3f}")
+                    print(f"   • OCR:     +{breakdown.get('ocr', 0.0):.3f} (일치율: {breakdown.get('ocr_ratio', 0.0):.1f}%)")
+                    print(f"   💡 Total Bonus: {sum([breakdown.get('brand', 0), breakdown.get('name', 0), breakdown.get('price', 0), breakdown.get('ocr', 0)]):.3f}")
+                    print("-" * 80)
+                    print(f"⭐ Final Score (정규화): {final_score:.4f}")
+                    if reasons:
+                        print(f"📝 Reasons: {' | '.join(reasons)}")
+                    print("=" * 80)
+                    print()
+                    debug_scored += 1
+
+            scores = np.array([c['final_score'] for c in candidates])
+        else:
+            # 문자열 매칭이 필요한 보너스만 후보별로 계산하고,
+            # 최종 산식은 배치 커널로 한 번에 처리
+            bonus_scores = [
+                calculate_bonus_score(item, user_inputs, detected, pre=pre)
+                for item, pre in zip(candidates, pres)
+            ]
+            # 후보 전체 최종 점수를 JIT/배치 루프 한 번으로 계산
+            base_weight = WEIGHTS["base_score_weight"]
+            max_possible = 1.0 * base_weight + WEIGHTS["max_bonus"] * (1.0 - base_weight)
+            if max_possible > 0:
+                scores = _score_batch(
+                    np.array([c['similarity_score'] for c in candidates], dtype=np.float64),
+                    np.array(bonus_scores, dtype=np.float64),
+                    base_weight,
+                    max_possible,
+                )
             else:
-                final_score = calculate_final_score(item, user_inputs, detected_texts)
-                reasons = []
-                breakdown = {}
-
-            if DEBUG_SCORING and debug_scored < DEBUG_SCORING_LIMIT:
-                print("=" * 80)
-                print(f"🔍 DEBUG [{debug_scored + 1}/{DEBUG_SCORING_LIMIT}] - {item.get('name', 'Unknown')}")
-                print(f"📦 ID: {item_id}")
-                print(f"🏢 Maker: {item.get('maker', 'N/A')}")
-                print(f"💰 Price: {item.get('price', 'N/A')}")
-                print("-" * 80)
-                print(f"📊 Base Score (벡터 유사도): {item['similarity_score']:.4f}")
-                print(f"🎁 Bonus Breakdown:")
-                print(f"   • Brand:   +{breakdown.get('brand', 0.0):.3f}")
-                print(f"   • Name:    +{breakdown.get('name', 0.0):.3f}")
-                print(f"   • Price:   +{breakdown.get('price', 0.0):.3f}")
-                print(f"   • OCR:     +{breakdown.get('ocr', 0.0):.3f} (일치율: {breakdown.get('ocr_ratio', 0.0):.1f}%)")
-                print(f"   💡 Total Bonus: {sum([breakdown.get('brand', 0), breakdown.get('name', 0), breakdown.get('price', 0), breakdown.get('ocr', 0)]):.3f}")
-                print("-" * 80)
-                print(f"⭐ Final Score (정규화): {final_score:.4f}")
-                if reasons:
-                    print(f"📝 Reasons: {' | '.join(reasons)}")
-                print("=" * 80)
-                print()
-                debug_scored += 1
-
-            item['final_score'] = final_score
-            candidates.append(item)
+                scores = np.zeros(len(candidates))
+            for c, score in zip(candidates, scores):
+                c['final_score'] = float(score)
 
-        # 6. 점수 높은 순으로 정렬 후 상위 20개 자르기
-        candidates.sort(key=lambda x: x['final_score'], reverse=True)
-        top_20 = candidates[:20]
+        # 6. 상위 20개만 추리기: argpartition(퀵셀렉트)으로 O(N) 선별 후
+        #    뽑힌 20개만 정렬 (전체 50개를 다 정렬할 필요 없음)
+        top_k = min(20, len(scores))
+        if top_k < len(scores):
+            top_idx = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            top_idx = np.arange(len(scores))
+        top_idx = top_idx[np.argsort(-scores[top_idx])]
+        top_20 = [candidates[i] for i in top_idx]
 
         response_payload = {
             "status": "success",
@@ -605,8 +994,13 @@ async def search_by_image(
             "results": top_20
         }
 
-        with open(RESPONSE_JSON_PATH, "w", encoding="utf-8") as f:
-            json.dump(response_payload, f, ensure_ascii=False, indent=2)
+        # 결과 뷰어용 파일 기록은 응답을 보낸 뒤 백그라운드에서 처리
+        if WRITE_RESPONSE_JSON:
+            task = asyncio.create_task(
+                asyncio.to_thread(_write_response_json, response_payload)
+            )
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
 
         return response_payload
 
@@ -618,11 +1012,27 @@ async def search_by_image(
 
 if __name__ == "__main__":
     import sys
+
+    # uvloop/httptools가 설치돼 있으면 이벤트 루프/HTTP 파서를 C 구현으로
+    # (없으면 stdlib asyncio/h11로 기존과 동일하게 동작)
+    try:
+        import uvloop  # noqa: F401
+        loop_impl = "uvloop"
+    except ImportError:
+        loop_impl = "asyncio"
+    try:
+        import httptools  # noqa: F401
+        http_impl = "httptools"
+    except ImportError:
+        http_impl = "h11"
+
     # reload 모드에서는 메인 프로세스에서 불필요한 모델 로드 방지
     uvicorn.run(
         "server:app",
         host="0.0.0.0",
         port=8000,
         reload=False,
-        reload_excludes=["*.pyc", "__pycache__"]
+        reload_excludes=["*.pyc", "__pycache__"],
+        loop=loop_impl,
+        http=http_impl,
     )
\ No newline at end of file